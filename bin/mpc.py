@@ -194,8 +194,15 @@ def run_operations(
     # initialize energy in the battery with the initial soc
     energy_in_the_battery = bat_size_kwh * initial_soc
 
+    # the ground truth at every set point time, looked up once instead of per MPC step
+    simulation_times = fc.index[:hours_of_simulation]  # TODO change to hours_of_simulation
+    set_point_times = simulation_times + timedelta(hours=1)
+    gt_at_set_points = fc.loc[set_point_times, "Ground Truth"].to_numpy()
+
     operations = {}
-    for t in fc.index[:hours_of_simulation]:  # TODO change to hours_of_simulation
+    for t, set_point_time, gt_at_set_point in zip(
+        simulation_times, set_point_times, gt_at_set_points
+    ):
         # get load forecast as a list
         load = get_forecasts(df=fc, h=t, fc_type=fc_type, horizon=horizon)
 
@@ -218,8 +225,7 @@ def run_operations(
         )
 
         # implement set point in time, calculate net and tier load, this
-        set_point_time = t + timedelta(hours=1)
-        net_load = fc.loc[set_point_time]["Ground Truth"] + set_point["bss_p_ch"]
+        net_load = gt_at_set_point + set_point["bss_p_ch"]
         tier1_load = (
             net_load if net_load <= tier_load_magnitude else tier_load_magnitude
         )
@@ -26,6 +26,7 @@ from utils.data_utils import (
     create_directory,
 )
 import numpy as np
+from joblib import Parallel, delayed
 import wandb
 
 from utils.paths import ROOT_DIR, EVAL_DIR, RESULTS_DIR
@@ -33,27 +34,27 @@ from utils.paths import ROOT_DIR, EVAL_DIR, RESULTS_DIR
 from utils.model_utils import Config
 
 
-def run_opt(load_forecast, bss_energy, config, prices=None):
+def build_model(T_len, config):
     ################################
     # MPC optimization model
     ################################
     m = ConcreteModel()
-    m.T = Set(initialize=list(range(len(load_forecast))))
+    m.T = Set(initialize=list(range(T_len)))
 
-    # MPC Params
-    m.demand = Param(m.T, initialize=load_forecast)
-    m.bss_energy_start = Param(initialize=bss_energy)
+    # MPC Params (mutable, updated in place at every MPC step)
+    m.demand = Param(m.T, initialize=0, mutable=True)
+    m.bss_energy_start = Param(initialize=0, mutable=True)
 
-    # Config Params
-    m.bss_size = Param(initialize=config.bat_size_kwh)
-    m.bss_max_pow = Param(initialize=config.bat_max_power)
-    m.bss_end_soc_weight = Param(initialize=config.bat_end_soc_weight)
+    # Config values, constant for the whole run, so plain floats instead of Params
+    bss_size = config.bat_size_kwh
+    bss_max_pow = config.bat_max_power
+    bss_end_soc_weight = config.bat_end_soc_weight
 
-    # variables
+    # variables (battery limits are passed to the solver as bounds, not as constraint rows)
     m.net_load = Var(m.T, domain=Reals)
     m.peak = Var(domain=NonNegativeReals)
-    m.bss_p_ch = Var(m.T, domain=Reals)
-    m.bss_en = Var(m.T, domain=NonNegativeReals)
+    m.bss_p_ch = Var(m.T, domain=Reals, bounds=(-bss_max_pow, bss_max_pow))
+    m.bss_en = Var(m.T, domain=NonNegativeReals, bounds=(0, bss_size))
 
     def energy_balance(m, t):
         return m.net_load[t] == m.bss_p_ch[t] + m.demand[t]
@@ -73,46 +74,71 @@ def run_opt(load_forecast, bss_energy, config, prices=None):
 
     m.bat_soc = Constraint(m.T, rule=bat_soc)
 
-    def bat_lim_energy(m, t):
-        return m.bss_en[t] <= m.bss_size
-
-    m.bat_lim_energy = Constraint(m.T, rule=bat_lim_energy)
-
-    def bat_lim_power_pos(m, t):
-        return m.bss_p_ch[t] <= m.bss_max_pow
-
-    m.bat_lim_power_pos = Constraint(m.T, rule=bat_lim_power_pos)
-
-    def bat_lim_power_neg(m, t):
-        return -m.bss_max_pow <= m.bss_p_ch[t]
-
-    m.bat_lim_power_neg = Constraint(m.T, rule=bat_lim_power_neg)
-
     def cost(m):
         bss_en_end = m.bss_en[len(m.T) - 1]
         terminal_cost = (bss_en_end - m.bss_energy_start) ** 2
 
         total_costs = (
-            1 - m.bss_end_soc_weight
-        ) * m.peak + m.bss_end_soc_weight * terminal_cost
+            1 - bss_end_soc_weight
+        ) * m.peak + bss_end_soc_weight * terminal_cost
 
         return total_costs
 
     m.ObjectiveFunction = Objective(rule=cost)
 
-    opt = SolverFactory("cplex")
-    results = opt.solve(m)
+    return m
+
+
+def build_solver(m):
+    """Persistent CPLEX instance that keeps the model (and its last basis) in memory between MPC steps"""
+    opt = SolverFactory("cplex_persistent")
+    opt.set_instance(m)
+    # warm start every MPC step from the basis of the previous one
+    opt.options["advance"] = 1
+
+    return opt
+
+
+# MPC model and persistent solver per horizon and battery config, built once per process
+MPC_INSTANCES = {}
+
+
+def get_mpc_instance(T_len, config):
+    key = (
+        T_len,
+        config.bat_size_kwh,
+        config.bat_max_power,
+        config.bat_end_soc_weight,
+    )
+    if key not in MPC_INSTANCES:
+        m = build_model(T_len, config)
+        MPC_INSTANCES[key] = (m, build_solver(m))
+
+    return MPC_INSTANCES[key]
 
-    # get results
-    res_df = pd.DataFrame(index=list(m.T))
-    for v in [m.net_load, m.bss_en, m.bss_p_ch]:
-        res_df = res_df.join(pd.Series(v.get_values(), name=v.getname()))
 
-    res_df["load_forecast"] = list(m.demand._data.values())
+def run_opt(m, opt, load_forecast, bss_energy):
+    for t in m.T:
+        m.demand[t].value = load_forecast[t]
+    m.bss_energy_start.value = bss_energy
 
-    # fig = px.line(res_df)
-    # fig.show()
-    sp = res_df.iloc[0].to_dict()
+    # the persistent solver holds the coefficients of the previous step, so only
+    # the constraints and the objective that depend on the MPC params are re-sent
+    for t in m.T:
+        opt.remove_constraint(m.energy_balance[t])
+        opt.add_constraint(m.energy_balance[t])
+    opt.remove_constraint(m.bat_soc[0])
+    opt.add_constraint(m.bat_soc[0])
+    opt.set_objective(m.ObjectiveFunction)
+
+    opt.solve(m)
+
+    # just returns the first (next time) set-point
+    sp = {
+        "net_load": m.net_load[0].value,
+        "bss_en": m.bss_en[0].value,
+        "bss_p_ch": m.bss_p_ch[0].value,
+    }
 
     return sp
 
@@ -124,24 +150,32 @@ def run_operations(dfs_mpc, config, key):
     # initialize energy in the battery with the initial soc
     energy_in_the_battery = config.bat_size_kwh * config.bat_initial_soc
 
-    operations = {}
-    for t, df_mpc in enumerate(dfs_mpc[:-1]):
-        # checks:
-        assert df_mpc.shape[0] == config.horizon, "Faulty horizon"
+    # checks:
+    assert all(
+        df_mpc.shape[0] == config.horizon for df_mpc in dfs_mpc[:-1]
+    ), "Faulty horizon"
+
+    # get the load forecasts and ground truths of all MPC steps, shape: (n_steps, horizon)
+    load_forecasts = np.stack([df_mpc.iloc[:, 0].to_numpy() for df_mpc in dfs_mpc[:-1]])
+    load_ground_truths = np.stack(
+        [df_mpc.iloc[:, 1].to_numpy() for df_mpc in dfs_mpc[:-1]]
+    )
+    if key == "gt":
+        load_forecasts = load_ground_truths
 
-        # count the number of nan values in the forecast
-        nan_count = df_mpc.isna().sum().sum()
+    # the horizon is fixed, so the same model and solver are reused for every MPC step
+    m, opt = get_mpc_instance(load_forecasts.shape[1], config)
 
-        # get the load forecast and ground truth
-        load_forecast = df_mpc.iloc[:, 0].values.tolist()
-        load_ground_truth = df_mpc.iloc[:, 1].values.tolist()
-        if key == "gt":
-            load_forecast = load_ground_truth
+    operations = []
+    for t in range(len(load_forecasts)):
+        load_forecast = load_forecasts[t]
+        load_ground_truth = load_ground_truths[t]
 
         sp = run_opt(
+            m,
+            opt,
             load_forecast=load_forecast,
             bss_energy=energy_in_the_battery,
-            config=config,
         )
 
         set_point = {}
@@ -164,12 +198,12 @@ def run_operations(dfs_mpc, config, key):
         # update energy in the battery
         energy_in_the_battery = sp["bss_en"]
 
-        operations.update({t: set_point})
+        operations.append(set_point)
 
-    df_operations = pd.DataFrame(operations).T
-
-    df_operations.index = pd.date_range(
-        dfs_mpc[0].index[0], periods=len(df_operations), freq="H"
+    # one float column per set-point field, built in a single pass
+    df_operations = pd.DataFrame(
+        operations,
+        index=pd.date_range(dfs_mpc[0].index[0], periods=len(operations), freq="H"),
     )
 
     return df_operations
@@ -201,6 +235,35 @@ def calculate_nle_stats(df_op, config):
     return nle_stats
 
 
+def align_and_scale(df_forecast, df_gt, gt_min, gt_max):
+    """Puts the ground truth next to the forecast (left join on the forecast index) and scales both with the min and max of the ground truth"""
+    gt_index = df_gt.index.asi8
+    fc_index = df_forecast.index.asi8
+
+    # position of every forecast timestamp in the (sorted) ground truth index
+    pos = np.searchsorted(gt_index, fc_index).clip(max=len(gt_index) - 1)
+    gt_aligned = np.where(
+        gt_index[pos] == fc_index, df_gt.iloc[:, 0].to_numpy()[pos], np.nan
+    )
+
+    # float32 is plenty for the solver tolerances and halves the memory traffic,
+    # the scaling is done in place on the one buffer allocated per forecast
+    values = np.empty((len(df_forecast), df_forecast.shape[1] + 1), dtype=np.float32)
+    values[:, :-1] = df_forecast.to_numpy()
+    values[:, -1] = gt_aligned
+    np.subtract(values, gt_min, out=values)
+    np.divide(values, gt_max - gt_min, out=values)
+
+    df = pd.DataFrame(
+        values,
+        index=df_forecast.index,
+        columns=[*df_forecast.columns, *df_gt.columns],
+    )
+    df.fillna(method="pad", inplace=True)
+
+    return df
+
+
 def run_nle(eval_dict, scale, location, horizon, season, model):
     print(f"Running NLE for Horizon: {horizon} and Season: {season}")
 
@@ -239,12 +302,7 @@ def run_nle(eval_dict, scale, location, horizon, season, model):
 
     # Ground truth operations and costs as baseline
     dfs = [
-        (
-            ((ts_forecast.pd_dataframe().join(df_gt, how="left")) - gt_min).fillna(
-                method="pad"
-            )
-            / (gt_max - gt_min)
-        )
+        align_and_scale(ts_forecast.pd_dataframe(), df_gt, gt_min, gt_max)
         for ts_forecast in ts_list_per_model[model]
     ]
 
@@ -253,10 +311,13 @@ def run_nle(eval_dict, scale, location, horizon, season, model):
     nle_stats_dict = {}
     dfs_operations = []
 
-    for key, dfs_mpc in dfs_mpc_dict.items():
-        # running operations
-        df_operations = run_operations(dfs_mpc, nle_config, key)
+    # running operations, the rollouts are independent of each other and run in parallel
+    dfs_operations_per_key = Parallel(n_jobs=len(dfs_mpc_dict), backend="loky")(
+        delayed(run_operations)(dfs_mpc, nle_config, key)
+        for key, dfs_mpc in dfs_mpc_dict.items()
+    )
 
+    for key, df_operations in zip(dfs_mpc_dict.keys(), dfs_operations_per_key):
         # calculating nle stats
         nle_stats = calculate_nle_stats(df_operations, nle_config)
 
@@ -1,4 +1,5 @@
 import datetime
+import functools
 import os
 import pickle
 import random
@@ -8,34 +9,86 @@ from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+from scipy import special
 from scipy.spatial.distance import euclidean
 from scipy.stats import boxcox
 from sklearn.metrics import mean_squared_error, make_scorer
 from sklearn.preprocessing import MinMaxScaler
 import holidays
+from numba import njit
 
 from scipy.stats import boxcox
 from scipy.signal import find_peaks_cwt
 
 
+def pivot_regular_timeseries(df):
+    """
+    Pivots a single column timeseries on a regular, tz-naive grid into days x time of day by reshaping its values.
+    Returns None if the timeseries does not qualify, so the caller can fall back to pandas pivot.
+    """
+    if not isinstance(df.index, pd.DatetimeIndex) or df.index.tz is not None:
+        return None
+    if df.shape[1] != 1 or len(df) < 2:
+        return None
+
+    freq_ns = int(infer_frequency(df) * 60 * 10**9)
+    if freq_ns == 0 or NS_PER_DAY % freq_ns != 0:
+        return None
+    steps_per_day = NS_PER_DAY // freq_ns
+
+    # position of every timestamp on the grid starting at midnight of the first day
+    start = df.index.min().normalize().value
+    offsets = df.index.asi8 - start
+    if np.any(offsets % freq_ns != 0):
+        return None
+    pos = offsets // freq_ns
+    if len(np.unique(pos)) != len(pos):
+        return None
+
+    n_days = pos.max() // steps_per_day + 1
+    values = np.full(n_days * steps_per_day, np.nan)
+    values[pos] = df.iloc[:, 0].to_numpy(dtype=float)
+    present = np.zeros(n_days * steps_per_day, dtype=bool)
+    present[pos] = True
+    values = values.reshape(n_days, steps_per_day)
+    present = present.reshape(n_days, steps_per_day)
+
+    # like pivot, only keep the days and times of day that occur in the timeseries
+    days = present.any(axis=1)
+    times = present.any(axis=0)
+    dates = pd.DatetimeIndex(start + np.arange(n_days) * NS_PER_DAY, name="date")
+    times_of_day = (
+        pd.Timestamp(0) + pd.to_timedelta(np.arange(steps_per_day) * freq_ns)
+    ).time
+
+    df_pivot = pd.DataFrame(
+        values[days][:, times], index=dates[days], columns=times_of_day[times]
+    )
+
+    return df_pivot
+
+
 def timeseries_dataframe_pivot(df):
-    df_ = df.copy()
-    df_["date"] = df_.index.date
-    df_["time"] = df_.index.time
+    df_pivot = pivot_regular_timeseries(df)
 
-    df_pivot = df_.pivot(index="date", columns="time")
+    if df_pivot is None:
+        df_ = df.copy()
+        df_["date"] = df_.index.date
+        df_["time"] = df_.index.time
 
-    n_days, n_timesteps = df_pivot.shape
+        df_pivot = df_.pivot(index="date", columns="time")
 
-    df_pivot.dropna(thresh=n_timesteps // 5, inplace=True)
+        df_pivot = df_pivot.droplevel(0, axis=1)
 
-    df_pivot = df_pivot.fillna(method="ffill", axis=0)
+        df_pivot.columns.name = None
+
+        df_pivot.index = pd.DatetimeIndex(df_pivot.index)
 
-    df_pivot = df_pivot.droplevel(0, axis=1)
+    n_days, n_timesteps = df_pivot.shape
 
-    df_pivot.columns.name = None
+    df_pivot.dropna(thresh=n_timesteps // 5, inplace=True)
 
-    df_pivot.index = pd.DatetimeIndex(df_pivot.index)
+    df_pivot = df_pivot.fillna(method="ffill", axis=0)
 
     return df_pivot
 
@@ -69,9 +122,13 @@ def boxcox_transform(dataframe, lam=None):
     Returns:
     transformed_dataframe (pandas.DataFrame): Pandas dataframe containing the transformed timeseries.
     """
-    transformed_dataframe = dataframe.copy()
-    for column in transformed_dataframe.columns:
-        transformed_dataframe[column], lam = boxcox(transformed_dataframe[column], lam)  # type: ignore
+    values = dataframe.to_numpy(dtype=float)
+    if lam is None:
+        # lambda is fitted on the first column and applied to all columns
+        _, lam = boxcox(values[:, 0])  # type: ignore
+    transformed_dataframe = pd.DataFrame(
+        special.boxcox(values, lam), index=dataframe.index, columns=dataframe.columns
+    )
     return transformed_dataframe, lam
 
 
@@ -86,14 +143,14 @@ def inverse_boxcox_transform(dataframe, lam):
     Returns:
     transformed_dataframe (pandas.DataFrame): Pandas dataframe containing the inverse-transformed timeseries.
     """
-    transformed_dataframe = dataframe.copy()
-    for column in transformed_dataframe.columns:
-        if lam == 0:
-            transformed_dataframe[column] = np.exp(transformed_dataframe[column])
-        else:
-            transformed_dataframe[column] = np.exp(
-                np.log(lam * transformed_dataframe[column] + 1) / lam
-            )
+    values = dataframe.to_numpy(dtype=float)
+    if lam == 0:
+        values = np.exp(values)
+    else:
+        values = np.exp(np.log1p(lam * values) / lam)
+    transformed_dataframe = pd.DataFrame(
+        values, index=dataframe.index, columns=dataframe.columns
+    )
     return transformed_dataframe
 
 
@@ -172,7 +229,12 @@ rmse_scorer = make_scorer(mean_squared_error, greater_is_better=False)
 
 def infer_frequency(df):
     """Infers the frequency of a timeseries dataframe and returns the value in minutes"""
-    freq = df.index.to_series().diff().mode()[0].seconds / 60
+    ts = df.index.asi8
+    if len(ts) < 2:
+        raise ValueError("At least two timestamps are needed to infer the frequency.")
+    # most common step between timestamps (the smallest one on ties), in ns
+    steps, counts = np.unique(np.diff(ts), return_counts=True)
+    freq = pd.Timedelta(steps[counts.argmax()], unit="ns").seconds / 60
     return freq
 
 
@@ -247,16 +309,14 @@ def calc_rolling_sum_of_load(df, n_days):
 
 
 def create_datetime_features(df):
-    df["day_of_week"] = df.index.dayofweek
-    df["day_of_week_sin"] = np.sin(2 * np.pi * df["day_of_week"] / 7)
-    df["day_of_week_cos"] = np.cos(2 * np.pi * df["day_of_week"] / 7)
-    df.drop("day_of_week", axis=1, inplace=True)
-    df["month"] = df.index.month
-    df["month_sin"] = np.sin(2 * np.pi * df["month"] / 12)
-    df["month_cos"] = np.cos(2 * np.pi * df["month"] / 12)
+    day_of_week = df.index.dayofweek.to_numpy()
+    month = df.index.month.to_numpy()
+    df["day_of_week_sin"] = np.sin(2 * np.pi * day_of_week / 7)
+    df["day_of_week_cos"] = np.cos(2 * np.pi * day_of_week / 7)
+    df["month_sin"] = np.sin(2 * np.pi * month / 12)
+    df["month_cos"] = np.cos(2 * np.pi * month / 12)
     # is weekend
-    df["is_weekend"] = df.index.dayofweek > 4
-    df.drop("month", axis=1, inplace=True)
+    df["is_weekend"] = day_of_week > 4
     return df
 
 
@@ -276,27 +336,47 @@ def create_holiday_features(df, df_holidays, df_holiday_periods=None):
     return df_3
 
 
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+
+@njit(cache=True)
+def days_to_next(ts, hol_ts):
+    "Days until the next holiday for each timestamp, both sorted int64 arrays in ns (0 if there is none)"
+    days = np.zeros(len(ts), dtype=np.int64)
+    j = 0
+    for i in range(len(ts)):
+        while j < len(hol_ts) and hol_ts[j] < ts[i]:
+            j += 1
+        if j < len(hol_ts):
+            days[i] = (hol_ts[j] - ts[i]) // NS_PER_DAY
+    return days
+
+
+@njit(cache=True)
+def days_since_last(ts, hol_ts):
+    "Days since the last holiday for each timestamp, both sorted int64 arrays in ns (0 if there is none)"
+    days = np.zeros(len(ts), dtype=np.int64)
+    j = -1
+    for i in range(len(ts)):
+        while j + 1 < len(hol_ts) and hol_ts[j + 1] <= ts[i]:
+            j += 1
+        if j >= 0:
+            days[i] = (ts[i] - hol_ts[j]) // NS_PER_DAY
+    return days
+
+
 def days_until_next_holiday_encoder(df, df_holidays):
     df_concat = pd.concat([df, df_holidays], axis=1)
-    df_concat["days_until_next_holiday"] = 0
-    for ind in df_concat.index:
-        try:
-            next_holiday = df_concat["holiday_dummy"].loc[ind:].first_valid_index()
-            days_until_next_holiday = (next_holiday - ind).days
-            df_concat.loc[ind, "days_until_next_holiday"] = days_until_next_holiday
-        except:
-            pass
+    hol_ts = df_concat.index[df_concat["holiday_dummy"].notna()].asi8
+    df_concat["days_until_next_holiday"] = days_to_next(df_concat.index.asi8, hol_ts)
 
     return df_concat[["days_until_next_holiday"]]
 
 
 def days_since_last_holiday_encoder(df, df_holidays):
     df_concat = pd.concat([df, df_holidays], axis=1)
-    df_concat["days_since_last_holiday"] = 0
-    for ind in df_concat.index:
-        next_holiday = df_concat["holiday_dummy"].loc[:ind].last_valid_index()
-        days_since_last_holiday = (ind - next_holiday).days
-        df_concat.loc[ind, "days_since_last_holiday"] = days_since_last_holiday
+    hol_ts = df_concat.index[df_concat["holiday_dummy"].notna()].asi8
+    df_concat["days_since_last_holiday"] = days_since_last(df_concat.index.asi8, hol_ts)
 
     return df_concat[["days_since_last_holiday"]]
 
@@ -308,15 +388,21 @@ def get_year_list(df):
     return list(years)
 
 
-def get_holidays(years, shortcut):
+@functools.lru_cache(maxsize=128)
+def get_holiday_dates(shortcut, years):
+    "Returns the sorted holiday dates and the holiday dummies of a country, cached per (shortcut, years)"
     country = getattr(holidays, shortcut)
-    holidays_dict = country(years=years)
-    df_holidays = pd.DataFrame(holidays_dict.values(), index=holidays_dict.keys())
-    df_holidays[0] = 1
-    df_holidays_dummies = df_holidays
-    df_holidays_dummies.columns = ["holiday_dummy"]
-    df_holidays_dummies.index = pd.DatetimeIndex(df_holidays.index)
-    df_holidays_dummies = df_holidays_dummies.sort_index()
+    holidays_dict = country(years=list(years))
+    holiday_dates = pd.DatetimeIndex(list(holidays_dict.keys())).sort_values()
+    holiday_dummies = np.ones(len(holiday_dates), dtype=np.int64)
+    return holiday_dates, holiday_dummies
+
+
+def get_holidays(years, shortcut):
+    holiday_dates, holiday_dummies = get_holiday_dates(shortcut, tuple(years))
+    df_holidays_dummies = pd.DataFrame(
+        {"holiday_dummy": holiday_dummies.copy()}, index=holiday_dates
+    )
 
     return df_holidays_dummies
 
@@ -324,11 +410,23 @@ def get_holidays(years, shortcut):
 def calc_metrics(df_compare, metrics):
     "calculates metrics for a dataframe with a ground truth column and predictions, ground truth column must be the first column"
     metric_series_list = {}
+    # errors of all columns against the ground truth, shared by the vectorized metrics
+    values = df_compare.to_numpy(dtype=float)
+    errors = values - values[:, [0]]
     for metric in metrics:
         metric_name = metric.__name__
-        metric_result = df_compare.apply(
-            lambda x: metric(x, df_compare.iloc[:, 0]), axis=0
-        )
+        if metric_name == "mean_squared_error":
+            metric_result = pd.Series(
+                np.mean(errors**2, axis=0), index=df_compare.columns
+            )
+        elif metric_name == "mean_absolute_error":
+            metric_result = pd.Series(
+                np.mean(np.abs(errors), axis=0), index=df_compare.columns
+            )
+        else:
+            metric_result = df_compare.apply(
+                lambda x: metric(x, df_compare.iloc[:, 0]), axis=0
+            )
         if metric.__name__ == "mean_squared_error":
             metric_result = np.sqrt(metric_result)
             metric_name = "root_mean_squared_error"
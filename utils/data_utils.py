@@ -123,13 +123,26 @@ def get_weather_data(lat, lng, start_date, end_date, variables: list, keep_UTC=T
 
 def drop_duplicate_index(df):
     "This function drops duplicate indices from a dataframe."
-    df = df[~df.index.duplicated(keep="first")]
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.is_monotonic_increasing:
+        # duplicates of a sorted index are neighbours, one shifted compare finds them
+        ts = df.index.asi8
+        mask = np.empty(len(ts), dtype=bool)
+        mask[:1] = True
+        np.not_equal(ts[1:], ts[:-1], out=mask[1:])
+    else:
+        mask = ~df.index.duplicated(keep="first")
+    df = df[mask]
     return df
 
 
 def infer_frequency(df):
     """Infers the frequency of a timeseries dataframe and returns the value in minutes"""
-    freq = df.index.to_series().diff().mode()[0].seconds / 60
+    ts = df.index.asi8
+    if len(ts) < 2:
+        raise ValueError("At least two timestamps are needed to infer the frequency.")
+    # most common step between timestamps (the smallest one on ties), in ns
+    steps, counts = np.unique(np.diff(ts), return_counts=True)
+    freq = pd.Timedelta(steps[counts.argmax()], unit="ns").seconds / 60
     return freq
 
 
@@ -183,7 +196,7 @@ def ts_list_concat(ts_list, n_ahead):
     """
     This function concatenates a list of time series into one time series.
     """
-    df_forecast = pd.concat([ts.pd_dataframe() for ts in ts_list][::n_ahead], axis=0)
+    df_forecast = pd.concat([ts.pd_dataframe() for ts in ts_list[::n_ahead]], axis=0)
     ts = TimeSeries.from_dataframe(df_forecast)
 
     return ts
@@ -211,11 +224,8 @@ def get_df_compares_list(historics, gt):
 def get_df_diffs(df_list):
     """Returns a dataframe with the differences between the first column and the rest of the columns"""
 
-    df_diffs = pd.DataFrame(index=range(df_list[0].shape[0]))
-    for df in df_list:
-        df_diff = df.copy()
-        diff = (df_diff.iloc[:, 0].values - df_diff.iloc[:, 1]).values
-        df_diffs = pd.concat([df_diffs, pd.DataFrame(diff)], axis=1)
+    diffs = [df.iloc[:, 0].to_numpy() - df.iloc[:, 1].to_numpy() for df in df_list]
+    df_diffs = pd.DataFrame(np.column_stack(diffs), index=range(df_list[0].shape[0]))
     return df_diffs
 
 
@@ -335,8 +345,7 @@ def remove_days(df_raw, p=0.05):
 
 
 def remove_duplicate_index(df):
-    df = df.loc[~df.index.duplicated(keep="first")]
-    return df
+    return drop_duplicate_index(df)
 
 
 # results analysis / wandb api interaction
@@ -68,6 +68,13 @@ class Config:
     def __setitem__(self, key, value):
         self.data[key] = value
 
+    def __getstate__(self):
+        # only the data dict is pickled, e.g. when the config is sent to worker processes
+        return self.data
+
+    def __setstate__(self, state):
+        self.data = state
+
     @classmethod
     def from_dict(cls, data, is_initial_config=True):
         config = cls()